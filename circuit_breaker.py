@@ -0,0 +1,119 @@
+"""
+Circuit breaker around the model endpoint.
+
+After enough consecutive connection failures, timeouts or overload responses
+the circuit opens and extractions fail fast as "deferred" instead of each
+waiting out its own timeout. Once the reset timeout passes, a single probe
+request is let through (half-open); its outcome closes or re-opens the circuit.
+"""
+import os
+import time
+from typing import Optional
+
+import httpx
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Give up on an invoice after it has been deferred this many times
+# (about an hour of outage with the default 30 s reset timeout)
+MAX_DEFERRALS = 120
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """
+    Decide whether an error means the endpoint itself is degraded.
+
+    Connection errors, timeouts, 5xx and 429 responses count; other 4xx
+    responses are problems with the request and leave the circuit alone.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(error, httpx.TransportError)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with half-open probing."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: Consecutive endpoint failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a probe is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.next_probe_at = 0.0
+
+    def allow_request(self) -> bool:
+        """Return True if a request may be sent now; half-open lets one probe through per reset timeout."""
+        if self.state == CLOSED:
+            return True
+
+        now = time.monotonic()
+        if now < self.next_probe_at:
+            return False
+
+        # Let this request probe the endpoint; hold everything else back until it reports
+        self.state = HALF_OPEN
+        self.next_probe_at = now + self.reset_timeout
+        return True
+
+    def is_closed(self) -> bool:
+        """True while requests flow normally (not open and not probing)."""
+        return self.state == CLOSED
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe may be sent (0 when closed)."""
+        if self.state == CLOSED:
+            return 0.0
+        return max(0.0, self.next_probe_at - time.monotonic())
+
+    def record_success(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = OPEN
+            self.next_probe_at = time.monotonic() + self.reset_timeout
+
+
+def get_http_timeout() -> httpx.Timeout:
+    """
+    Separate connect/read/write/pool timeouts for extraction requests.
+
+    Configured with EXTRACTION_CONNECT_TIMEOUT, EXTRACTION_READ_TIMEOUT and
+    EXTRACTION_WRITE_TIMEOUT (seconds), so a dead endpoint fails on connect
+    long before a slow-but-working one times out on read.
+    """
+    connect = float(os.getenv("EXTRACTION_CONNECT_TIMEOUT", "5"))
+    return httpx.Timeout(
+        connect=connect,
+        read=float(os.getenv("EXTRACTION_READ_TIMEOUT", "60")),
+        write=float(os.getenv("EXTRACTION_WRITE_TIMEOUT", "20")),
+        pool=connect,
+    )
+
+
+_circuit_breaker: Optional[CircuitBreaker] = None
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """
+    Get the process-wide circuit breaker for the model endpoint.
+
+    CIRCUIT_FAILURE_THRESHOLD and CIRCUIT_RESET_TIMEOUT override the defaults.
+    """
+    global _circuit_breaker
+    if _circuit_breaker is None:
+        _circuit_breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30")),
+        )
+    return _circuit_breaker
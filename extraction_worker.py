@@ -0,0 +1,98 @@
+"""
+Extraction worker: runs queued invoice jobs outside the web process.
+
+Usage:
+    python extraction_worker.py --concurrency 3
+
+Start as many workers as the API budget allows; they share the job queue
+(JOB_QUEUE_DB) and, with RATE_LIMIT_DB set, one rate limit.
+"""
+import os
+import asyncio
+import argparse
+
+from hedging import get_hedge_policy
+from invoice_extractor import extract_invoice_data
+from job_queue import MAX_ATTEMPTS, get_job_queue
+
+# How often the worker logs hedged-request statistics
+STATS_INTERVAL_SECONDS = 60.0
+
+
+async def log_hedge_stats(interval: float = STATS_INTERVAL_SECONDS):
+    """Print hedge rate and win rate periodically while hedging is enabled."""
+    hedge_policy = get_hedge_policy()
+    if hedge_policy is None:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        stats = hedge_policy.stats()
+        delay = stats["hedge_delay"]
+        print(
+            f"[{os.getpid()}] Hedged {stats['hedges']}/{stats['requests']} requests "
+            f"({stats['hedge_rate']:.1%}), {stats['hedge_wins']} won ({stats['hedge_win_rate']:.1%}), "
+            f"hedge delay {'n/a' if delay is None else f'{delay:.1f}s'}"
+        )
+
+
+async def run_worker(concurrency: int = 3, poll_interval: float = 1.0):
+    """
+    Claim and process jobs until cancelled.
+
+    Args:
+        concurrency: Number of jobs processed at the same time
+        poll_interval: Seconds to wait when the queue is empty
+    """
+    queue = get_job_queue()
+
+    async def worker_loop(slot: int):
+        while True:
+            job = await asyncio.to_thread(queue.claim)
+            if job is None:
+                await asyncio.sleep(poll_interval)
+                continue
+
+            print(f"[{os.getpid()}:{slot}] Extracting {job['original_name']} (attempt {job['attempts']})")
+            try:
+                result = await extract_invoice_data(
+                    job["image_path"], session=job["session"], priority=job["priority"]
+                )
+            except asyncio.CancelledError:
+                # Shutting down: hand the job straight back instead of waiting out the lease
+                # (synchronously, since this task is already being cancelled)
+                queue.release(job["id"], job["lease_until"])
+                raise
+
+            if result["status"] == "deferred":
+                # Endpoint is down: park the job until the circuit breaker allows a probe
+                delay = max(result.get("retry_after", 0.0), 1.0)
+                kept = await asyncio.to_thread(queue.defer, job["id"], job["lease_until"], delay)
+            elif result.get("retryable") and job["attempts"] < MAX_ATTEMPTS:
+                # Transient endpoint error: try again later, counting this attempt
+                kept = await asyncio.to_thread(queue.retry, job["id"], job["lease_until"], 2.0 ** job["attempts"])
+            else:
+                kept = await asyncio.to_thread(queue.complete, job["id"], job["lease_until"], result)
+
+            if kept:
+                print(f"[{os.getpid()}:{slot}] {job['original_name']}: {result['status']}")
+            else:
+                print(f"[{os.getpid()}:{slot}] {job['original_name']}: lease lost, result discarded")
+
+    await asyncio.gather(log_hedge_stats(), *(worker_loop(slot) for slot in range(concurrency)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run invoice extraction jobs from the queue")
+    parser.add_argument("--concurrency", type=int, default=3, help="Jobs processed at once (default: 3)")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Idle poll interval in seconds")
+    args = parser.parse_args()
+
+    print(f"Extraction worker {os.getpid()} started with concurrency {args.concurrency}")
+    try:
+        asyncio.run(run_worker(args.concurrency, args.poll_interval))
+    except KeyboardInterrupt:
+        print("Extraction worker stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Hedged requests for Claude Vision API calls.
+
+When a request runs longer than a recent latency percentile, a duplicate is
+sent and whichever answers first wins; the other is cancelled. A budget caps
+hedges to a fraction of all requests. Enabled with EXTRACTION_HEDGE=1.
+"""
+import os
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class HedgePolicy:
+    """Fire a backup request when the primary is slower than recent traffic."""
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        budget: float = 0.05,
+        min_samples: int = 20,
+        window: int = 200,
+        min_delay: float = 1.0,
+    ):
+        """
+        Args:
+            percentile: Latency percentile after which a hedge is sent
+            budget: Maximum hedges as a fraction of requests (0.05 = 5%)
+            min_samples: Observed latencies needed before hedging starts
+            window: Number of recent latencies the percentile is taken over
+            min_delay: Never hedge sooner than this many seconds
+        """
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies: deque = deque(maxlen=window)
+
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None until enough latencies are observed."""
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        rank = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100.0))
+        return max(self.min_delay, ordered[rank])
+
+    def stats(self) -> Dict[str, Any]:
+        """Hedge counters: how often hedges were sent and how often they won."""
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": self.hedges / self.requests if self.requests else 0.0,
+            "hedge_win_rate": self.hedge_wins / self.hedges if self.hedges else 0.0,
+            "hedge_delay": self.hedge_delay(),
+        }
+
+    async def run(
+        self,
+        send: Callable[[], Awaitable[Any]],
+        admit_hedge: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> Any:
+        """
+        Run `send`, hedging it with a second call if it is slow.
+
+        Args:
+            send: Coroutine function performing one request
+            admit_hedge: Awaited before the hedge is sent (e.g. rate limiter admission)
+
+        Returns:
+            The result of the first call to succeed; if both fail, the primary's error is raised
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self.requests += 1
+
+        async def hedge():
+            if admit_hedge is not None:
+                await admit_hedge()
+            return await send()
+
+        primary = asyncio.ensure_future(send())
+        tasks = [primary]
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                await asyncio.wait({primary}, timeout=delay)
+                if not primary.done() and self.hedges < self.budget * self.requests:
+                    self.hedges += 1
+                    tasks.append(asyncio.ensure_future(hedge()))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        self.latencies.append(loop.time() - start)
+                        return task.result()
+
+            return primary.result()
+        finally:
+            losers = [task for task in tasks if not task.done()]
+            for task in losers:
+                task.cancel()
+            # Let cancelled requests unwind before the caller closes the shared HTTP client
+            if losers:
+                await asyncio.gather(*losers, return_exceptions=True)
+
+
+_hedge_policy: Optional[HedgePolicy] = None
+
+
+def get_hedge_policy() -> Optional[HedgePolicy]:
+    """
+    Get the process-wide hedge policy, or None unless EXTRACTION_HEDGE=1.
+
+    EXTRACTION_HEDGE_PERCENTILE and EXTRACTION_HEDGE_BUDGET tune when a hedge
+    fires and what fraction of requests may be hedged.
+    """
+    global _hedge_policy
+    if os.getenv("EXTRACTION_HEDGE", "0") != "1":
+        return None
+    if _hedge_policy is None:
+        _hedge_policy = HedgePolicy(
+            percentile=float(os.getenv("EXTRACTION_HEDGE_PERCENTILE", "95")),
+            budget=float(os.getenv("EXTRACTION_HEDGE_BUDGET", "0.05")),
+        )
+    return _hedge_policy
@@ -0,0 +1,227 @@
+"""
+Spending totals over extracted invoice rows.
+
+Rows get numeric columns (amount/GST in integer cents, ISO date, month) when
+they are created or edited, and the totals by category, ABN and month are kept
+up to date by adding and subtracting single rows. Bulk loads are summed with
+NumPy and merged in. Aggregates are plain dicts so they live in (backend) Reflex state:
+
+    {"total": group, "category": {key: group}, "abn": {...}, "month": {...}}
+
+where each group is {"amount_cents": int, "gst_cents": int, "count": int}.
+Only rows with a parsed amount are totalled, so failed extractions (which have
+no amount) do not inflate the invoice counts until someone fills one in.
+"""
+import re
+import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+DIMENSIONS = ("category", "abn", "month")
+UNKNOWN = "Unknown"
+
+_DATE_PATTERN = re.compile(r"^\s*(\d{1,2})[/.\-](\d{1,2})[/.\-](\d{2}|\d{4})\s*$")
+
+
+def parse_amount_cents(text: Any) -> Optional[int]:
+    """
+    Parse an amount such as "$1,234.50" or "AUD 12.5" into integer cents.
+
+    Returns:
+        Amount in cents, or None if no number can be read
+    """
+    if text is None:
+        return None
+    cleaned = re.sub(r"[^\d.\-]", "", str(text))
+    try:
+        value = Decimal(cleaned)
+    except InvalidOperation:
+        return None
+    return int((value * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def parse_invoice_date(text: Any) -> Optional[datetime.date]:
+    """
+    Parse a DD/MM/YYYY date (also DD-MM-YYYY, DD.MM.YY).
+
+    Returns:
+        The date, or None if it is not a valid DD/MM/YYYY date
+    """
+    match = _DATE_PATTERN.match(str(text or ""))
+    if not match:
+        return None
+    day, month, year = (int(part) for part in match.groups())
+    if year < 100:
+        year += 2000
+    try:
+        return datetime.date(year, month, day)
+    except ValueError:
+        return None
+
+
+def normalize_invoice_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fill a row's numeric columns from its text fields.
+
+    Sets amount_cents and gst_cents (int or None) and date_iso ("" if unparsed).
+
+    Returns:
+        The same row, updated in place
+    """
+    date = parse_invoice_date(row.get("date", ""))
+    row["amount_cents"] = parse_amount_cents(row.get("amount_inc_gst", ""))
+    row["gst_cents"] = parse_amount_cents(row.get("gst", ""))
+    row["date_iso"] = date.isoformat() if date else ""
+    return row
+
+
+def group_keys(row: Dict[str, Any]) -> Dict[str, str]:
+    """Category, ABN and month keys a row is totalled under."""
+    abn = re.sub(r"\D", "", str(row.get("abn", "")))
+    return {
+        "category": str(row.get("category", "")).strip() or UNKNOWN,
+        "abn": abn if len(abn) == 11 else UNKNOWN,
+        "month": row.get("date_iso", "")[:7] or UNKNOWN,
+    }
+
+
+def _empty_group() -> Dict[str, int]:
+    return {"amount_cents": 0, "gst_cents": 0, "count": 0}
+
+
+def empty_aggregates() -> Dict[str, Any]:
+    aggregates = {"total": _empty_group()}
+    for dimension in DIMENSIONS:
+        aggregates[dimension] = {}
+    return aggregates
+
+
+def _add_to_group(groups: Dict[str, Dict[str, int]], key: str, amount: int, gst: int, count: int):
+    group = groups.setdefault(key, _empty_group())
+    group["amount_cents"] += amount
+    group["gst_cents"] += gst
+    group["count"] += count
+    if group["count"] <= 0:
+        del groups[key]
+
+
+def apply_row(aggregates: Dict[str, Any], row: Dict[str, Any], sign: int = 1):
+    """
+    Add (sign=1) or remove (sign=-1) one normalized row's contribution.
+
+    Args:
+        aggregates: Aggregates to update in place
+        row: Row with numeric columns from normalize_invoice_row
+        sign: 1 to add the row, -1 to subtract it
+    """
+    if row.get("amount_cents") is None:
+        return
+
+    amount = sign * row["amount_cents"]
+    gst = sign * (row.get("gst_cents") or 0)
+
+    total = aggregates["total"]
+    total["amount_cents"] += amount
+    total["gst_cents"] += gst
+    total["count"] += sign
+
+    for dimension, key in group_keys(row).items():
+        _add_to_group(aggregates[dimension], key, amount, gst, sign)
+
+
+def build_aggregates(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Compute aggregates for many normalized rows at once.
+
+    Returns:
+        Aggregates equal to applying every row to empty_aggregates()
+    """
+    aggregates = empty_aggregates()
+    rows = [row for row in rows if row.get("amount_cents") is not None]
+    if not rows:
+        return aggregates
+
+    amounts = np.fromiter((row["amount_cents"] for row in rows), dtype=np.int64, count=len(rows))
+    gsts = np.fromiter((row.get("gst_cents") or 0 for row in rows), dtype=np.int64, count=len(rows))
+    keys = [group_keys(row) for row in rows]
+
+    aggregates["total"] = {
+        "amount_cents": int(amounts.sum()),
+        "gst_cents": int(gsts.sum()),
+        "count": len(rows),
+    }
+
+    for dimension in DIMENSIONS:
+        labels, inverse = np.unique([k[dimension] for k in keys], return_inverse=True)
+        # Group sums via int64 accumulation (bincount weights would round through float64)
+        amount_sums = np.zeros(len(labels), dtype=np.int64)
+        gst_sums = np.zeros(len(labels), dtype=np.int64)
+        np.add.at(amount_sums, inverse, amounts)
+        np.add.at(gst_sums, inverse, gsts)
+        counts = np.bincount(inverse, minlength=len(labels))
+
+        aggregates[dimension] = {
+            str(label): {"amount_cents": int(amount), "gst_cents": int(gst), "count": int(count)}
+            for label, amount, gst, count in zip(labels, amount_sums, gst_sums, counts)
+        }
+
+    return aggregates
+
+
+def merge_aggregates(aggregates: Dict[str, Any], other: Dict[str, Any]):
+    """Add the totals of `other` (e.g. from build_aggregates) into `aggregates` in place."""
+    total = aggregates["total"]
+    for field, value in other["total"].items():
+        total[field] += value
+
+    for dimension in DIMENSIONS:
+        for key, group in other[dimension].items():
+            _add_to_group(aggregates[dimension], key, group["amount_cents"], group["gst_cents"], group["count"])
+
+
+def format_cents(cents: int) -> str:
+    """Format cents as Australian dollars, e.g. 123450 -> "$1,234.50"."""
+    sign = "-" if cents < 0 else ""
+    return f"{sign}${abs(cents) / 100:,.2f}"
+
+
+def _summary_row(key: str, group: Dict[str, int]) -> Dict[str, str]:
+    return {
+        "key": key,
+        "amount": format_cents(group["amount_cents"]),
+        "gst": format_cents(group["gst_cents"]),
+        "count": str(group["count"]),
+    }
+
+
+def summary_rows(
+    groups: Dict[str, Dict[str, int]], by_key: bool = False, limit: Optional[int] = None
+) -> List[Dict[str, str]]:
+    """
+    Display rows for one dimension, largest spend first (or sorted by key, e.g. months).
+
+    Args:
+        groups: One dimension of the aggregates, e.g. aggregates["abn"]
+        by_key: Sort by key instead of by spend
+        limit: Show at most this many groups; the rest are summed into one "N others" row
+
+    Returns:
+        List of {"key", "amount", "gst", "count"} with formatted strings
+    """
+    if by_key:
+        ordered = sorted(groups.items())
+    else:
+        ordered = sorted(groups.items(), key=lambda item: item[1]["amount_cents"], reverse=True)
+
+    if limit is None or len(ordered) <= limit:
+        return [_summary_row(key, group) for key, group in ordered]
+
+    rest = _empty_group()
+    for _, group in ordered[limit:]:
+        for field, value in group.items():
+            rest[field] += value
+    rows = [_summary_row(key, group) for key, group in ordered[:limit]]
+    rows.append(_summary_row(f"{len(ordered) - limit} others", rest))
+    return rows
@@ -11,6 +11,10 @@ from pathlib import Path
 from dotenv import load_dotenv
 import httpx
 
+from circuit_breaker import MAX_DEFERRALS, get_circuit_breaker, get_http_timeout, is_endpoint_failure
+from hedging import get_hedge_policy
+from rate_limiter import PRIORITY_BULK, PRIORITY_INTERACTIVE, estimate_input_tokens, get_rate_limiter
+
 # Load environment variables
 load_dotenv()
 
@@ -42,12 +46,40 @@ def encode_image_to_base64(image_path: str) -> tuple[str, str]:
     return base64_image, media_type
 
 
-async def extract_invoice_data(image_path: str) -> Dict[str, Any]:
+def deferred_result(image_path: str, retry_after: float, message: str = "") -> Dict[str, Any]:
+    """
+    Build the result for an invoice parked because the model endpoint is degraded.
+
+    Deferred invoices are retried rather than reported as errors.
+
+    Args:
+        image_path: Path to the invoice image
+        retry_after: Seconds until the endpoint should be tried again
+        message: Reason shown to the user
+
+    Returns:
+        Result dictionary with status "deferred"
+    """
+    return {
+        "status": "deferred",
+        "message": message or f"API endpoint unavailable, retrying in {retry_after:.0f}s",
+        "retry_after": retry_after,
+        "file": os.path.basename(image_path)
+    }
+
+
+async def extract_invoice_data(
+    image_path: str,
+    session: str = "default",
+    priority: int = PRIORITY_INTERACTIVE,
+) -> Dict[str, Any]:
     """
     Extract invoice data from an image using Claude Vision API.
 
     Args:
         image_path: Path to the invoice image
+        session: Fairness key for the shared rate limiter (e.g. Reflex client token)
+        priority: PRIORITY_INTERACTIVE for uploads, PRIORITY_BULK for batch jobs
 
     Returns:
         Dictionary containing extracted invoice data
@@ -151,11 +183,52 @@ Return ONLY the JSON object, no additional text."""
             ]
         }
 
+        # Fail fast while the endpoint is known to be down; the caller parks the invoice
+        circuit_breaker = get_circuit_breaker()
+        probing = not circuit_breaker.is_closed()
+        if not circuit_breaker.allow_request():
+            return deferred_result(image_path, circuit_breaker.retry_after())
+
+        # Wait for a slot in the process-wide request/token budget
+        rate_limiter = get_rate_limiter()
+        input_tokens = estimate_input_tokens(image_path)
+        await rate_limiter.acquire(input_tokens, session, priority)
+
+        # The circuit may have opened while we queued; only the half-open probe goes ahead then
+        if not probing and not circuit_breaker.is_closed():
+            return deferred_result(image_path, circuit_breaker.retry_after())
+
         # Make request
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(api_url, headers=headers, json=payload)
-            response.raise_for_status()
-            result = response.json()
+        async with httpx.AsyncClient(timeout=get_http_timeout()) as client:
+            async def send_request() -> Dict[str, Any]:
+                response = await client.post(api_url, headers=headers, json=payload)
+                response.raise_for_status()
+                return response.json()
+
+            hedge_policy = get_hedge_policy()
+            try:
+                if hedge_policy is not None:
+                    # A hedge is a real API call, so it waits for its own rate limiter slot
+                    result = await hedge_policy.run(
+                        send_request,
+                        admit_hedge=lambda: rate_limiter.acquire(input_tokens, session, priority),
+                    )
+                else:
+                    result = await send_request()
+            except Exception as e:
+                if is_endpoint_failure(e):
+                    circuit_breaker.record_failure()
+                    # Park the invoice only once the circuit is open; a one-off timeout
+                    # or 5xx stays an ordinary error that counts against the job's attempts
+                    if not circuit_breaker.is_closed():
+                        return deferred_result(
+                            image_path, circuit_breaker.retry_after(), f"API endpoint unavailable: {str(e)}"
+                        )
+                elif isinstance(e, httpx.HTTPStatusError):
+                    # The endpoint answered; the problem is this request
+                    circuit_breaker.record_success()
+                raise
+            circuit_breaker.record_success()
 
             # Extract text from response
             content = result.get("content", [])
@@ -197,6 +270,8 @@ Return ONLY the JSON object, no additional text."""
             "status": "error",
             "message": f"API request failed: {str(e)}",
             "details": traceback.format_exc(),
+            # Timeouts, 5xx and 429 may succeed on a later attempt
+            "retryable": is_endpoint_failure(e),
             "file": os.path.basename(image_path)
         }
 
@@ -221,7 +296,23 @@ async def process_invoices(invoice_paths: List[str], max_concurrent: int = 3) ->
             print(f"Processing invoice {index}/{len(invoice_paths)}: {os.path.basename(path)}")
             print('='*60)
 
-            result = await extract_invoice_data(path)
+            result = await extract_invoice_data(path, session="process_invoices", priority=PRIORITY_BULK)
+
+            # Park deferred invoices until the endpoint recovers instead of failing them
+            deferrals = 0
+            while result["status"] == "deferred" and deferrals < MAX_DEFERRALS:
+                deferrals += 1
+                retry_after = max(result.get("retry_after", 0.0), 1.0)
+                print(f"⏸️  {os.path.basename(path)} deferred: {result['message']} (retrying in {retry_after:.0f}s)")
+                await asyncio.sleep(retry_after)
+                result = await extract_invoice_data(path, session="process_invoices", priority=PRIORITY_BULK)
+
+            if result["status"] == "deferred":
+                result = {
+                    "status": "error",
+                    "message": f"API endpoint still unavailable after {deferrals} retries",
+                    "file": os.path.basename(path)
+                }
 
             # Print result
             if result["status"] == "success":
@@ -275,6 +366,11 @@ async def main():
     print(f"\n{'='*60}")
     print(f"✅ All {len(results)} invoices processed!")
     print(f"✅ Results saved to: {output_file}")
+
+    hedge_policy = get_hedge_policy()
+    if hedge_policy is not None:
+        stats = hedge_policy.stats()
+        print(f"Hedged {stats['hedges']}/{stats['requests']} requests, {stats['hedge_wins']} hedges won")
     print('='*60)
 
 
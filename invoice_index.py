@@ -0,0 +1,210 @@
+"""
+Search indexes over invoice rows.
+
+Lets the invoice table filter by description text, ABN, category, date range
+and amount range without scanning every row. The index is a plain dict kept
+in Reflex state and updated one row at a time:
+
+    tokens     {token: {key: True}}  inverted index over description/category words
+    vocab      sorted list of tokens, for prefix matching with bisect
+    abn        {11 digits: {key: True}}
+    category   {lower-case category: {key: True}}
+    by_date    sorted [[date_iso, key], ...]
+    by_amount  sorted [[amount_cents, key], ...]
+    rows       {key: values indexed for the row}, used to unindex it
+    seq        {key: insertion number}, so results come back in table order
+
+Rows are keyed by their stored filename, which is unique and stable.
+"""
+import re
+import bisect
+from typing import Dict, List, Any, Optional
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Any) -> List[str]:
+    """Lower-case words in a string, without duplicates."""
+    return list(dict.fromkeys(_TOKEN_PATTERN.findall(str(text or "").lower())))
+
+
+def empty_index() -> Dict[str, Any]:
+    return {
+        "tokens": {},
+        "vocab": [],
+        "abn": {},
+        "category": {},
+        "by_date": [],
+        "by_amount": [],
+        "rows": {},
+        "seq": {},
+        "next_seq": 0,
+    }
+
+
+def _indexed_values(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "tokens": tokenize(f"{row.get('description', '')} {row.get('category', '')}"),
+        "abn": re.sub(r"\D", "", str(row.get("abn", ""))),
+        "category": str(row.get("category", "")).strip().lower(),
+        "date_iso": row.get("date_iso", ""),
+        "amount_cents": row.get("amount_cents"),
+    }
+
+
+def _add_posting(postings: Dict[str, Dict[str, bool]], value: str, key: str) -> bool:
+    """Add key under value; return True if value is new."""
+    if value in postings:
+        postings[value][key] = True
+        return False
+    postings[value] = {key: True}
+    return True
+
+
+def _remove_posting(postings: Dict[str, Dict[str, bool]], value: str, key: str) -> bool:
+    """Remove key from value; return True if value has no keys left."""
+    keys = postings.get(value)
+    if keys is None:
+        return False
+    keys.pop(key, None)
+    if keys:
+        return False
+    del postings[value]
+    return True
+
+
+def _remove_sorted(entries: List[Any], entry: Any):
+    pos = bisect.bisect_left(entries, entry)
+    if pos < len(entries) and entries[pos] == entry:
+        del entries[pos]
+
+
+def index_row(index: Dict[str, Any], key: str, row: Dict[str, Any]):
+    """
+    Add a row to the index, replacing any earlier version of it.
+
+    Args:
+        index: Index to update in place
+        key: Unique row key (stored filename)
+        row: Row with numeric columns from normalize_invoice_row
+    """
+    if key in index["rows"]:
+        unindex_row(index, key, keep_position=True)
+    else:
+        index["seq"][key] = index["next_seq"]
+        index["next_seq"] += 1
+
+    values = _indexed_values(row)
+    index["rows"][key] = values
+
+    for token in values["tokens"]:
+        if _add_posting(index["tokens"], token, key):
+            bisect.insort(index["vocab"], token)
+    if len(values["abn"]) == 11:
+        _add_posting(index["abn"], values["abn"], key)
+    if values["category"]:
+        _add_posting(index["category"], values["category"], key)
+    if values["date_iso"]:
+        bisect.insort(index["by_date"], [values["date_iso"], key])
+    if values["amount_cents"] is not None:
+        bisect.insort(index["by_amount"], [values["amount_cents"], key])
+
+
+def unindex_row(index: Dict[str, Any], key: str, keep_position: bool = False):
+    """
+    Remove a row from the index.
+
+    Args:
+        index: Index to update in place
+        key: Row key passed to index_row
+        keep_position: Keep the row's place in result order (used when re-indexing an edit)
+    """
+    values = index["rows"].pop(key, None)
+    if values is None:
+        return
+
+    for token in values["tokens"]:
+        if _remove_posting(index["tokens"], token, key):
+            _remove_sorted(index["vocab"], token)
+    if len(values["abn"]) == 11:
+        _remove_posting(index["abn"], values["abn"], key)
+    if values["category"]:
+        _remove_posting(index["category"], values["category"], key)
+    if values["date_iso"]:
+        _remove_sorted(index["by_date"], [values["date_iso"], key])
+    if values["amount_cents"] is not None:
+        _remove_sorted(index["by_amount"], [values["amount_cents"], key])
+
+    if not keep_position:
+        index["seq"].pop(key, None)
+
+
+def _range_keys(entries: List[list], low: Any, high: Any) -> set:
+    start = 0 if low is None else bisect.bisect_left(entries, [low, ""])
+    end = len(entries) if high is None else bisect.bisect_right(entries, [high, "\uffff"])
+    return {entry[1] for entry in entries[start:end]}
+
+
+def search(
+    index: Dict[str, Any],
+    text: str = "",
+    abn: str = "",
+    category: str = "",
+    date_from: str = "",
+    date_to: str = "",
+    amount_min: Optional[int] = None,
+    amount_max: Optional[int] = None,
+) -> Optional[List[str]]:
+    """
+    Find rows matching every given filter.
+
+    Args:
+        index: Index built with index_row
+        text: Words that must each prefix a description or category word
+        abn: ABN, any formatting
+        category: Category name, case-insensitive
+        date_from: Earliest ISO date (YYYY-MM-DD), inclusive
+        date_to: Latest ISO date, inclusive
+        amount_min: Smallest amount in cents, inclusive
+        amount_max: Largest amount in cents, inclusive
+
+    Returns:
+        Matching keys in insertion order, or None if no filter is set (all rows match)
+    """
+    candidate_sets = []
+
+    for word in tokenize(text):
+        vocab = index["vocab"]
+        start = bisect.bisect_left(vocab, word)
+        end = bisect.bisect_left(vocab, word + "\uffff")
+        keys = set()
+        for token in vocab[start:end]:
+            keys.update(index["tokens"][token])
+        candidate_sets.append(keys)
+
+    abn_digits = re.sub(r"\D", "", abn or "")
+    if abn_digits:
+        candidate_sets.append(set(index["abn"].get(abn_digits, {})))
+
+    if category and category.strip():
+        candidate_sets.append(set(index["category"].get(category.strip().lower(), {})))
+
+    if date_from or date_to:
+        candidate_sets.append(_range_keys(index["by_date"], date_from or None, date_to or None))
+
+    if amount_min is not None or amount_max is not None:
+        candidate_sets.append(_range_keys(index["by_amount"], amount_min, amount_max))
+
+    if not candidate_sets:
+        return None
+
+    # Intersect smallest first so each step only probes the remaining candidates
+    candidate_sets.sort(key=len)
+    matches = candidate_sets[0]
+    for keys in candidate_sets[1:]:
+        if not matches:
+            break
+        matches = matches & keys
+
+    seq = index["seq"]
+    return sorted(matches, key=seq.__getitem__)
@@ -1,33 +1,82 @@
 import reflex as rx
+import asyncio
 import csv
 import io
 import uuid
 import sys
 import os
+import time
 
 # Add parent directory to path to import invoice_extractor
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from invoice_extractor import extract_invoice_data
+from job_queue import get_job_queue
+from invoice_aggregates import (
+    apply_row,
+    build_aggregates,
+    empty_aggregates,
+    format_cents,
+    merge_aggregates,
+    normalize_invoice_row,
+    parse_amount_cents,
+    parse_invoice_date,
+    summary_rows,
+)
+from invoice_index import empty_index, index_row, search, unindex_row
+
+# Invoice table rows shown per page
+PAGE_SIZE = 50
+# How often an open page checks the job queue for its results
+JOB_POLL_SECONDS = 1.0
+# Largest categories and ABNs listed in the spending summary; the rest are summed into one row
+SUMMARY_TOP_N = 10
+# Queued jobs are shown as stale once no worker has made progress on the queue for this long
+STALE_JOB_SECONDS = 600.0
+WAITING_STATUSES = ("uploading", "queued", "deferred", "extracting")
 
 
 class ImageState(rx.State):
-    images: list[dict] = []
+    # Number of invoice rows; the rows themselves stay on the server (see _images)
+    image_count: int = 0
     processing_files: list[dict] = []
     is_uploading: bool = False
     show_image_modal: bool = False
     current_image_url: str = ""
+    # Table filters and the current page of matching rows (each with its "idx" in _images),
+    # the only rows sent to the browser
+    filters: dict[str, str] = {
+        "text": "",
+        "abn": "",
+        "category": "",
+        "date_from": "",
+        "date_to": "",
+        "amount_min": "",
+        "amount_max": "",
+    }
+    page: int = 0
+    match_count: int = 0
+    visible_rows: list[dict] = []
+    # All invoice rows, the search indexes over them, and each row's position by filename
+    _images: list[dict] = []
+    _search_index: dict = empty_index()
+    _positions: dict[str, int] = {}
+    # Spend/GST totals by category, ABN and month, kept in step with _images;
+    # only the spend_* summaries computed from them reach the browser
+    _spend_aggregates: dict = empty_aggregates()
+    _jobs_polled_at: float = 0.0
+    # Results of jobs submitted before the last "Clear All" are dropped
+    _cleared_at: float = 0.0
 
     @rx.event
     async def handle_upload(self, files: list[rx.UploadFile]):
-        import asyncio
+        queue = get_job_queue()
+        session = self.router.session.client_token
 
         self.is_uploading = True
-        self.processing_files = [{"name": f.filename, "status": "queued"} for f in files]
+        self.processing_files = [{"name": f.filename, "status": "uploading", "job_id": ""} for f in files]
         yield
 
-        # Process files concurrently (up to 3 at a time)
-        async def process_single_file(idx: int, file):
-            # Save the file
+        # Save each file and hand it to the extraction workers
+        for idx, file in enumerate(files):
             data = await file.read()
             unique_name = f"{uuid.uuid4().hex[:8]}_{file.name}"
             path = rx.get_upload_dir() / unique_name
@@ -35,70 +84,120 @@ class ImageState(rx.State):
             with path.open("wb") as f:
                 f.write(data)
 
-            # Extract invoice data with AI
-            extraction_result = await extract_invoice_data(str(path))
+            self.processing_files[idx]["job_id"] = await asyncio.to_thread(
+                queue.enqueue,
+                session,
+                str(path.resolve()),
+                unique_name,
+                file.name,
+                round(len(data) / 1024, 2),
+            )
+            self.processing_files[idx]["status"] = "queued"
+
+        # Results arrive in the background so this tab's other events are not held up
+        yield ImageState.poll_jobs
+
+    @rx.event(background=True)
+    async def poll_jobs(self):
+        """
+        Deliver this session's extraction results as workers finish them.
+
+        Started after each upload and on page load, so results that finished
+        while the page was away (e.g. a backend restart) are picked up too.
+        Stops once no job is left waiting. Queued jobs are shown as stale, and
+        no longer polled, only when no worker has claimed or finished any job
+        for STALE_JOB_SECONDS; deferred jobs are always polled, so they resume
+        on their own when the endpoint recovers.
+        """
+        async with self:
+            # One poller per session; a heartbeat (not a flag) so a poller lost in a restart is replaced
+            if time.time() - self._jobs_polled_at < 5 * JOB_POLL_SECONDS:
+                return
+            self._jobs_polled_at = time.time()
+            session = self.router.session.client_token
+
+        queue = get_job_queue()
+        while True:
+            finished = await asyncio.to_thread(queue.take_finished, session)
+            pending = await asyncio.to_thread(queue.pending_jobs, session)
+            last_progress = await asyncio.to_thread(queue.last_progress)
+
+            async with self:
+                self._jobs_polled_at = time.time()
+                self._deliver_jobs(finished)
+                self._update_processing(pending, last_progress)
+
+                waiting = [f for f in self.processing_files if f["status"] in WAITING_STATUSES]
+                if not waiting:
+                    # Keep stale jobs on screen; a reload polls for them again
+                    self.processing_files = [f for f in self.processing_files if f["status"] == "stale"]
+                    self.is_uploading = False
+                    self._jobs_polled_at = 0.0
+                    return
+
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+    def _update_processing(self, pending: list[dict], last_progress: float | None):
+        now = time.time()
+        # Workers are idle or gone, not just busy with a long queue
+        workers_stalled = now - (last_progress or 0.0) > STALE_JOB_SECONDS
+        by_job = {f["job_id"]: f for f in self.processing_files}
+        for job in pending:
+            if job["status"] == "running":
+                status = "extracting"
+            elif job["status"] == "queued" and workers_stalled and now - job["created"] > STALE_JOB_SECONDS:
+                status = "stale"
+            else:
+                status = job["status"]
+
+            if job["id"] in by_job:
+                by_job[job["id"]]["status"] = status
+            else:
+                # Job from before a reload or restart
+                self.processing_files.append({"name": job["original_name"], "status": status, "job_id": job["id"]})
+        if pending:
+            self.is_uploading = True
+
+    def _deliver_jobs(self, finished: list[dict]):
+        new_rows = []
+        for job in finished:
+            if job["created"] < self._cleared_at:
+                # Taken from the queue just before the images were cleared
+                continue
+            extraction_result = job["result"]
+            success = extraction_result.get("status") == "success"
 
             invoice_data = {}
-            if extraction_result["status"] == "success":
+            if success:
                 invoice_data = extraction_result.get("data", {})
             else:
                 invoice_data = {"error": extraction_result.get("message", "Extraction failed")}
 
-            return {
-                "idx": idx,
-                "unique_name": unique_name,
-                "original_name": file.name,
-                "size_kb": round(len(data) / 1024, 2),
-                "invoice_data": invoice_data,
-                "success": extraction_result["status"] == "success",
-            }
-
-        # Process in batches of 3
-        for i in range(0, len(files), 3):
-            batch = files[i:i+3]
-            batch_indices = range(i, min(i+3, len(files)))
-
-            # Mark batch as uploading
-            for idx in batch_indices:
-                self.processing_files[idx]["status"] = "uploading"
-            yield
-
-            # Process batch concurrently
-            tasks = [process_single_file(idx, file) for idx, file in zip(batch_indices, batch)]
-            results = await asyncio.gather(*tasks)
-
-            # Mark as extracting and update results
-            for result in results:
-                idx = result["idx"]
-                self.processing_files[idx]["status"] = "extracting"
-            yield
-
-            # Add results to images
-            for result in results:
-                idx = result["idx"]
-                invoice_data = result["invoice_data"]
-
-                self.images.append({
-                    "id": len(self.images) + 1,
-                    "filename": result["unique_name"],
-                    "original_name": result["original_name"],
-                    "size_kb": result["size_kb"],
-                    "date": invoice_data.get("date", ""),
-                    "abn": invoice_data.get("abn", ""),
-                    "amount_inc_gst": invoice_data.get("amount_inc_gst", ""),
-                    "gst": invoice_data.get("gst", ""),
-                    "description": invoice_data.get("description", ""),
-                    "category": invoice_data.get("category", ""),
-                })
-
-                self.processing_files[idx]["status"] = "done" if result["success"] else "error"
-
-            yield
-
-        # Clear processing list
-        self.is_uploading = False
-        self.processing_files = []
-        yield
+            row = normalize_invoice_row({
+                "id": len(self._images) + len(new_rows) + 1,
+                "filename": job["filename"],
+                "original_name": job["original_name"],
+                "size_kb": job["size_kb"],
+                "date": invoice_data.get("date", ""),
+                "abn": invoice_data.get("abn", ""),
+                "amount_inc_gst": invoice_data.get("amount_inc_gst", ""),
+                "gst": invoice_data.get("gst", ""),
+                "description": invoice_data.get("description", ""),
+                "category": invoice_data.get("category", ""),
+            })
+            new_rows.append(row)
+
+            for f in self.processing_files:
+                if f["job_id"] == job["id"]:
+                    f["status"] = "done" if success else "error"
+
+        if new_rows:
+            for row in new_rows:
+                self._positions[row["filename"]] = len(self._images)
+                self._images.append(row)
+                index_row(self._search_index, row["filename"], row)
+            merge_aggregates(self._spend_aggregates, build_aggregates(new_rows))
+            self._refresh_view()
 
     @rx.event
     def open_image(self, image_url: str):
@@ -112,34 +211,142 @@ class ImageState(rx.State):
 
     @rx.event
     def update_field(self, idx: int, field: str, value: str):
-        self.images[idx][field] = value
+        row = self._images[idx]
+        apply_row(self._spend_aggregates, row, sign=-1)
+        row[field] = value
+        normalize_invoice_row(row)
+        apply_row(self._spend_aggregates, row)
+        index_row(self._search_index, row["filename"], row)
+
+        # Update the row where it is shown without re-running the search, so a row
+        # being edited does not vanish mid-word when it stops matching the filters
+        for pos, visible in enumerate(self.visible_rows):
+            if visible["idx"] == idx:
+                self.visible_rows[pos] = {**row, "idx": idx}
+                break
 
     @rx.event
     def delete_image(self, idx: int):
         # Delete the actual file from disk
-        if idx < len(self.images):
-            filename = self.images[idx]["filename"]
+        if idx < len(self._images):
+            filename = self._images[idx]["filename"]
             file_path = rx.get_upload_dir() / filename
             if file_path.exists():
                 file_path.unlink()
 
-        self.images.pop(idx)
+        row = self._images.pop(idx)
+        apply_row(self._spend_aggregates, row, sign=-1)
+        unindex_row(self._search_index, row["filename"])
+
+        # Rows after the deleted one move up a place
+        del self._positions[row["filename"]]
+        for pos in range(idx, len(self._images)):
+            self._positions[self._images[pos]["filename"]] = pos
+        self._refresh_view()
 
     @rx.event
-    def clear_all_images(self):
+    async def clear_all_images(self):
         import shutil
 
+        # Stop workers extracting images that are about to be deleted
+        await asyncio.to_thread(get_job_queue().cancel_session, self.router.session.client_token)
+        self._cleared_at = time.time()
+        self.processing_files = []
+        self.is_uploading = False
+
         # Delete all uploaded files from disk
         upload_dir = rx.get_upload_dir()
         if upload_dir.exists():
             shutil.rmtree(upload_dir)
             upload_dir.mkdir(parents=True, exist_ok=True)
 
-        self.images = []
+        self._images = []
+        self._spend_aggregates = empty_aggregates()
+        self._search_index = empty_index()
+        self._positions = {}
+        self._refresh_view()
         yield rx.toast("All images and files deleted from server!", duration=2000)
 
+    @rx.event
+    def set_filter(self, field: str, value: str):
+        self.filters[field] = value
+        self.page = 0
+        self._refresh_view()
+
+    @rx.event
+    def clear_filters(self):
+        self.filters = {field: "" for field in self.filters}
+        self.page = 0
+        self._refresh_view()
+
+    @rx.event
+    def next_page(self):
+        if (self.page + 1) * PAGE_SIZE < self.match_count:
+            self.page += 1
+            self._refresh_view()
+
+    @rx.event
+    def prev_page(self):
+        if self.page > 0:
+            self.page -= 1
+            self._refresh_view()
+
+    def _refresh_view(self):
+        """Look up the rows matching the filters in the indexes and load the current page."""
+        date_from = parse_invoice_date(self.filters["date_from"])
+        date_to = parse_invoice_date(self.filters["date_to"])
+        keys = search(
+            self._search_index,
+            text=self.filters["text"],
+            abn=self.filters["abn"],
+            category=self.filters["category"],
+            date_from=date_from.isoformat() if date_from else "",
+            date_to=date_to.isoformat() if date_to else "",
+            amount_min=parse_amount_cents(self.filters["amount_min"]),
+            amount_max=parse_amount_cents(self.filters["amount_max"]),
+        )
+
+        self.image_count = len(self._images)
+        self.match_count = self.image_count if keys is None else len(keys)
+        # Stay on a page that still exists after deletes or edits
+        self.page = max(0, min(self.page, (self.match_count - 1) // PAGE_SIZE))
+        start = self.page * PAGE_SIZE
+        end = min(start + PAGE_SIZE, self.match_count)
+
+        if keys is None:
+            positions = range(start, end)
+        else:
+            positions = [self._positions[key] for key in keys[start:end]]
+        self.visible_rows = [{**self._images[pos], "idx": pos} for pos in positions]
+
+    @rx.var
+    def page_label(self) -> str:
+        page_count = max(1, -(-self.match_count // PAGE_SIZE))
+        return f"Page {self.page + 1} of {page_count}"
+
+    @rx.var
+    def spend_total(self) -> dict[str, str]:
+        total = self._spend_aggregates["total"]
+        return {
+            "amount": format_cents(total["amount_cents"]),
+            "gst": format_cents(total["gst_cents"]),
+            "count": str(total["count"]),
+        }
+
+    @rx.var
+    def spend_by_category(self) -> list[dict[str, str]]:
+        return summary_rows(self._spend_aggregates["category"], limit=SUMMARY_TOP_N)
+
+    @rx.var
+    def spend_by_abn(self) -> list[dict[str, str]]:
+        return summary_rows(self._spend_aggregates["abn"], limit=SUMMARY_TOP_N)
+
+    @rx.var
+    def spend_by_month(self) -> list[dict[str, str]]:
+        return summary_rows(self._spend_aggregates["month"], by_key=True)
+
     def download_csv(self):
-        if not self.images:
+        if not self._images:
             return rx.toast("No data to download")
 
         output = io.StringIO()
@@ -148,7 +355,7 @@ class ImageState(rx.State):
             "gst", "description", "category", "size_kb"
         ])
         writer.writeheader()
-        for img in self.images:
+        for img in self._images:
             writer.writerow({
                 "id": img["id"],
                 "original_name": img["original_name"],
@@ -242,6 +449,88 @@ def image_row(img: dict, idx: int):
     )
 
 
+def filter_input(field: str, placeholder: str, width: str):
+    return rx.input(
+        value=ImageState.filters[field],
+        on_change=lambda val: ImageState.set_filter(field, val),
+        debounce_timeout=300,
+        placeholder=placeholder,
+        width=width,
+    )
+
+
+def filter_bar():
+    return rx.hstack(
+        rx.icon("search", size=18, color="gray"),
+        filter_input("text", "Merchant or description", "220px"),
+        filter_input("abn", "ABN", "140px"),
+        filter_input("category", "Category", "140px"),
+        filter_input("date_from", "From DD/MM/YYYY", "140px"),
+        filter_input("date_to", "To DD/MM/YYYY", "140px"),
+        filter_input("amount_min", "Min $", "90px"),
+        filter_input("amount_max", "Max $", "90px"),
+        rx.button(
+            "Clear",
+            on_click=ImageState.clear_filters,
+            variant="ghost",
+            size="2",
+        ),
+        spacing="2",
+        align="center",
+        wrap="wrap",
+        width="100%",
+    )
+
+
+def summary_table(title: str, rows):
+    return rx.vstack(
+        rx.text(title, size="2", weight="bold"),
+        rx.table.root(
+            rx.table.body(
+                rx.foreach(
+                    rows,
+                    lambda row: rx.table.row(
+                        rx.table.cell(row["key"]),
+                        rx.table.cell(row["amount"]),
+                        rx.table.cell(row["gst"], color="gray"),
+                        rx.table.cell(row["count"], color="gray"),
+                    ),
+                )
+            ),
+            size="1",
+            width="100%",
+        ),
+        spacing="1",
+        width="100%",
+    )
+
+
+def spending_summary():
+    return rx.card(
+        rx.vstack(
+            rx.hstack(
+                rx.heading("💰 Spending Summary", size="4"),
+                rx.spacer(),
+                rx.badge(f"Total {ImageState.spend_total['amount']}", color_scheme="green", variant="soft"),
+                rx.badge(f"GST {ImageState.spend_total['gst']}", variant="soft"),
+                width="100%",
+                align="center",
+            ),
+            rx.grid(
+                summary_table("By Category", ImageState.spend_by_category),
+                summary_table("By ABN", ImageState.spend_by_abn),
+                summary_table("By Month", ImageState.spend_by_month),
+                columns=rx.breakpoints(initial="1", md="3"),
+                spacing="4",
+                width="100%",
+            ),
+            spacing="3",
+            width="100%",
+        ),
+        width="100%",
+    )
+
+
 def index():
     return rx.container(
         rx.vstack(
@@ -290,6 +579,14 @@ def index():
                                     f["status"] == "extracting",
                                     rx.spinner(size="2"),
                                 ),
+                                rx.cond(
+                                    f["status"] == "deferred",
+                                    rx.icon("circle-pause", size=18, color="orange"),
+                                ),
+                                rx.cond(
+                                    f["status"] == "stale",
+                                    rx.icon("circle-alert", size=18, color="orange"),
+                                ),
                                 rx.cond(
                                     f["status"] == "done",
                                     rx.icon("circle-check", size=18, color="green"),
@@ -307,6 +604,14 @@ def index():
                                     f["status"] == "extracting",
                                     rx.badge("🧠 Extracting with AI...", color_scheme="purple", variant="soft"),
                                 ),
+                                rx.cond(
+                                    f["status"] == "deferred",
+                                    rx.badge("Deferred - API unavailable", color_scheme="orange", variant="soft"),
+                                ),
+                                rx.cond(
+                                    f["status"] == "stale",
+                                    rx.badge("Waiting for a worker - reload to check again", color_scheme="orange", variant="soft"),
+                                ),
                                 rx.cond(
                                     f["status"] == "done",
                                     rx.badge("✓ Done", color_scheme="green", variant="soft"),
@@ -326,12 +631,18 @@ def index():
                 ),
             ),
 
+            # Spending summary (read from incrementally maintained aggregates)
+            rx.cond(
+                ImageState.image_count > 0,
+                spending_summary(),
+            ),
+
             # Table header and export
             rx.hstack(
                 rx.heading("📋 Invoice Data", size="6"),
                 rx.spacer(),
                 rx.text(
-                    f"{ImageState.images.length()} images",
+                    f"{ImageState.match_count} of {ImageState.image_count} images",
                     size="2",
                     color="gray",
                 ),
@@ -342,7 +653,7 @@ def index():
                             "Clear All",
                             variant="soft",
                             color_scheme="red",
-                            disabled=ImageState.images.length() == 0,
+                            disabled=ImageState.image_count == 0,
                         ),
                     ),
                     rx.dialog.content(
@@ -372,16 +683,22 @@ def index():
                     "Export CSV",
                     on_click=ImageState.download_csv,
                     variant="soft",
-                    disabled=ImageState.images.length() == 0,
+                    disabled=ImageState.image_count == 0,
                 ),
                 spacing="3",
                 width="100%",
                 align="center",
             ),
 
-            # Editable table
+            # Filters (matched server-side against the search indexes)
+            rx.cond(
+                ImageState.image_count > 0,
+                filter_bar(),
+            ),
+
+            # Editable table (current page of matching rows)
             rx.cond(
-                ImageState.images.length() > 0,
+                ImageState.image_count > 0,
                 rx.table.root(
                     rx.table.header(
                         rx.table.row(
@@ -398,8 +715,8 @@ def index():
                     ),
                     rx.table.body(
                         rx.foreach(
-                            ImageState.images,
-                            lambda img, idx: image_row(img, idx),
+                            ImageState.visible_rows,
+                            lambda img: image_row(img, img["idx"]),
                         )
                     ),
                     width="100%",
@@ -411,14 +728,38 @@ def index():
                 ),
             ),
 
-            # Image grid preview
+            # Pagination
+            rx.cond(
+                ImageState.match_count > PAGE_SIZE,
+                rx.hstack(
+                    rx.button(
+                        rx.icon("chevron-left", size=16),
+                        on_click=ImageState.prev_page,
+                        variant="soft",
+                        disabled=ImageState.page == 0,
+                    ),
+                    rx.text(ImageState.page_label, size="2"),
+                    rx.button(
+                        rx.icon("chevron-right", size=16),
+                        on_click=ImageState.next_page,
+                        variant="soft",
+                        disabled=(ImageState.page + 1) * PAGE_SIZE >= ImageState.match_count,
+                    ),
+                    spacing="3",
+                    justify="center",
+                    align="center",
+                    width="100%",
+                ),
+            ),
+
+            # Image grid preview (same page of matching rows as the table)
             rx.cond(
-                ImageState.images.length() > 0,
+                ImageState.image_count > 0,
                 rx.vstack(
                     rx.heading("Preview Gallery", size="6"),
                     rx.grid(
                         rx.foreach(
-                            ImageState.images,
+                            ImageState.visible_rows,
                             lambda img: rx.card(
                                 rx.inset(
                                     rx.image(
@@ -485,4 +826,4 @@ def index():
 
 
 app = rx.App()
-app.add_page(index)
+app.add_page(index, on_load=ImageState.poll_jobs)
@@ -0,0 +1,402 @@
+"""
+Durable queue of invoice extraction jobs.
+
+The web app persists each upload and enqueues a job; separate worker processes
+(extraction_worker.py) claim jobs, run the extraction and store the result,
+which the web app then delivers to the owning session. Each claim carries a
+lease deadline that the worker passes back when it reports, so a worker whose
+lease expired cannot overwrite a job another worker now holds. Jobs live in a SQLite
+file (JOB_QUEUE_DB), so restarting either side does not lose work: a job whose
+worker died is reclaimed once its lease expires, and a job deferred while the
+model endpoint is down runs again once the circuit breaker lets requests through.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+from typing import Dict, List, Any, Optional
+
+from circuit_breaker import MAX_DEFERRALS
+from rate_limiter import PRIORITY_INTERACTIVE
+
+# Give up on a job that has been claimed this many times without finishing
+MAX_ATTEMPTS = 3
+# How long a worker may hold a job before another worker can reclaim it
+LEASE_SECONDS = 300.0
+
+
+class SQLiteJobQueue:
+    """Job queue stored in a SQLite file shared by web and worker processes."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, "
+                "session TEXT NOT NULL, "
+                "priority INTEGER NOT NULL, "
+                "image_path TEXT NOT NULL, "
+                "filename TEXT NOT NULL, "
+                "original_name TEXT NOT NULL, "
+                "size_kb REAL NOT NULL, "
+                "status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "deferrals INTEGER NOT NULL DEFAULT 0, "
+                "available_at REAL NOT NULL, "
+                "lease_until REAL, "
+                "result TEXT, "
+                "delivered INTEGER NOT NULL DEFAULT 0, "
+                "created REAL NOT NULL, "
+                "updated REAL)"
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "deferrals" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN deferrals INTEGER NOT NULL DEFAULT 0")
+            if "updated" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN updated REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority, created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session, delivered)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated)")
+            # When each session last had a job claimed, so sessions take turns
+            conn.execute("CREATE TABLE IF NOT EXISTS session_turns (session TEXT PRIMARY KEY, served REAL NOT NULL)")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(
+        self,
+        session: str,
+        image_path: str,
+        filename: str,
+        original_name: str,
+        size_kb: float,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> str:
+        """
+        Add an extraction job for an already-saved image.
+
+        Args:
+            session: Session that receives the result
+            image_path: Absolute path of the saved image (must be readable by workers)
+            filename: Stored file name shown in the table
+            original_name: Name of the file as uploaded
+            size_kb: File size in KB
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BULK
+
+        Returns:
+            The new job id
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, session, priority, image_path, filename, original_name, "
+                "size_kb, status, available_at, created) VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, session, priority, image_path, filename, original_name, size_kb, now, now),
+            )
+        finally:
+            conn.close()
+        return job_id
+
+    def claim(self, lease_seconds: float = LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """
+        Take the most urgent runnable job, including jobs whose lease has expired.
+
+        Within a priority, sessions take turns: the job comes from the session
+        with the fewest jobs running, then the one served longest ago, so one
+        large upload cannot hold up everyone else's.
+
+        Returns:
+            The claimed job as a dictionary, or None if nothing is runnable; its
+            "lease_until" must be passed back to complete/release/retry/defer
+        """
+        conn = self._connect()
+        try:
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                row = conn.execute(
+                    "SELECT jobs.* FROM jobs "
+                    "LEFT JOIN (SELECT session, COUNT(*) AS running FROM jobs "
+                    "WHERE status = 'running' AND lease_until >= ? GROUP BY session) AS busy "
+                    "ON busy.session = jobs.session "
+                    "LEFT JOIN session_turns ON session_turns.session = jobs.session "
+                    "WHERE (jobs.status IN ('queued', 'deferred') AND jobs.available_at <= ?) "
+                    "OR (jobs.status = 'running' AND jobs.lease_until < ?) "
+                    "ORDER BY jobs.priority, COALESCE(busy.running, 0), "
+                    "COALESCE(session_turns.served, 0), jobs.created LIMIT 1",
+                    (now, now, now),
+                ).fetchone()
+
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                if row["attempts"] >= MAX_ATTEMPTS:
+                    result = {
+                        "status": "error",
+                        "message": f"Extraction abandoned after {row['attempts']} attempts",
+                        "file": row["filename"],
+                    }
+                    conn.execute(
+                        "UPDATE jobs SET status = 'error', result = ?, lease_until = NULL, updated = ? WHERE id = ?",
+                        (json.dumps(result), now, row["id"]),
+                    )
+                    conn.execute("COMMIT")
+                    continue
+
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, "
+                    "updated = ? WHERE id = ?",
+                    (now + lease_seconds, now, row["id"]),
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO session_turns (session, served) VALUES (?, ?)",
+                    (row["session"], now),
+                )
+                conn.execute("COMMIT")
+                job = dict(row)
+                job["status"] = "running"
+                job["attempts"] += 1
+                job["lease_until"] = now + lease_seconds
+                return job
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _update_leased(self, job_id: str, lease_until: float, assignments: str, params: tuple) -> bool:
+        # The lease deadline fences out workers whose claim has since expired or been cancelled
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND status = 'running' AND lease_until = ?",
+                (*params, job_id, lease_until),
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def complete(self, job_id: str, lease_until: float, result: Dict[str, Any]) -> bool:
+        """
+        Store a finished extraction result.
+
+        Args:
+            job_id: Job to finish
+            lease_until: Lease deadline returned by claim
+            result: Return value of extract_invoice_data
+
+        Returns:
+            False if the lease was lost (the job was reclaimed or cancelled) and nothing was stored
+        """
+        status = "done" if result.get("status") == "success" else "error"
+        return self._update_leased(
+            job_id,
+            lease_until,
+            "status = ?, result = ?, lease_until = NULL, updated = ?",
+            (status, json.dumps(result), time.time()),
+        )
+
+    def release(self, job_id: str, lease_until: float) -> bool:
+        """
+        Put a claimed job straight back on the queue without counting the attempt
+        (e.g. when a worker shuts down mid-job).
+
+        Returns:
+            False if the lease was already lost
+        """
+        return self._update_leased(
+            job_id,
+            lease_until,
+            "status = 'queued', attempts = MAX(attempts - 1, 0), available_at = ?, lease_until = NULL",
+            (time.time(),),
+        )
+
+    def retry(self, job_id: str, lease_until: float, delay: float = 0.0) -> bool:
+        """
+        Requeue a job after a transient failure; the attempt still counts.
+
+        Args:
+            job_id: Job to requeue
+            lease_until: Lease deadline returned by claim
+            delay: Seconds before the job becomes runnable again
+
+        Returns:
+            False if the lease was already lost
+        """
+        now = time.time()
+        return self._update_leased(
+            job_id,
+            lease_until,
+            "status = 'queued', available_at = ?, lease_until = NULL, updated = ?",
+            (now + delay, now),
+        )
+
+    def defer(self, job_id: str, lease_until: float, delay: float) -> bool:
+        """
+        Park a job while the model endpoint is down (circuit breaker open).
+
+        Deferrals do not count as attempts, but are capped separately: after
+        MAX_DEFERRALS the job fails instead of waiting forever.
+
+        Args:
+            job_id: Job to park
+            lease_until: Lease deadline returned by claim
+            delay: Seconds until the circuit breaker allows its next probe
+
+        Returns:
+            False if the lease was already lost
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute(
+                "SELECT deferrals, filename FROM jobs WHERE id = ? AND status = 'running' AND lease_until = ?",
+                (job_id, lease_until),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return False
+
+            if row["deferrals"] + 1 >= MAX_DEFERRALS:
+                result = {
+                    "status": "error",
+                    "message": f"API endpoint still unavailable after {row['deferrals'] + 1} retries",
+                    "file": row["filename"],
+                }
+                conn.execute(
+                    "UPDATE jobs SET status = 'error', result = ?, deferrals = deferrals + 1, "
+                    "lease_until = NULL, updated = ? WHERE id = ?",
+                    (json.dumps(result), now, job_id),
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'deferred', attempts = MAX(attempts - 1, 0), "
+                    "deferrals = deferrals + 1, available_at = ?, lease_until = NULL, updated = ? WHERE id = ?",
+                    (now + delay, now, job_id),
+                )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def cancel_session(self, session: str):
+        """
+        Drop all of a session's unfinished and undelivered jobs (e.g. when its images are deleted).
+
+        Running jobs are cancelled too; their workers lose the lease, so their results are discarded.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', lease_until = NULL WHERE session = ? "
+                "AND status IN ('queued', 'deferred', 'running')",
+                (session,),
+            )
+            conn.execute("UPDATE jobs SET delivered = 1 WHERE session = ? AND delivered = 0", (session,))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def pending_jobs(self, session: str) -> List[Dict[str, Any]]:
+        """
+        List a session's jobs that have not finished yet.
+
+        Returns:
+            Jobs (id, original_name, status, created) in submission order, where
+            status is queued, deferred or running
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, original_name, status, created FROM jobs WHERE session = ? "
+                "AND status IN ('queued', 'deferred', 'running') ORDER BY created",
+                (session,),
+            )
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    def last_progress(self) -> Optional[float]:
+        """
+        When any worker last claimed, requeued or finished a job.
+
+        Returns:
+            Unix time of the latest progress in the whole queue, or None if there has been none
+        """
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT MAX(updated) FROM jobs").fetchone()[0]
+        finally:
+            conn.close()
+
+    def take_finished(self, session: str) -> List[Dict[str, Any]]:
+        """
+        Collect finished jobs for a session that have not been delivered yet.
+
+        Each job is returned once; its "result" is decoded from JSON.
+
+        Returns:
+            Finished jobs in submission order
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE session = ? AND delivered = 0 "
+                "AND status IN ('done', 'error') ORDER BY created",
+                (session,),
+            ).fetchall()
+            conn.executemany("UPDATE jobs SET delivered = 1 WHERE id = ?", [(row["id"],) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["result"] = json.loads(job["result"]) if job["result"] else {}
+            jobs.append(job)
+        return jobs
+
+
+_job_queue: Optional[SQLiteJobQueue] = None
+
+
+def get_job_queue() -> SQLiteJobQueue:
+    """
+    Get the job queue for this process, stored at JOB_QUEUE_DB.
+
+    Any object with the same enqueue/claim/complete/release/retry/defer/
+    cancel_session/pending_jobs/last_progress/take_finished methods (e.g. a Redis-backed queue) can stand in for it.
+    """
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = SQLiteJobQueue(os.getenv("JOB_QUEUE_DB", "invoice_jobs.sqlite3"))
+    return _job_queue
@@ -0,0 +1,359 @@
+"""
+Process-wide admission control for Claude Vision API calls.
+
+A token bucket on requests per minute and estimated input tokens per minute,
+shared by every Reflex session and CLI run in the process. Waiters are admitted
+fairly: interactive uploads before bulk jobs, round-robin across sessions within
+each priority. Set RATE_LIMIT_DB to a SQLite file path so several backend
+workers draw from one budget; across processes, bulk callers may not draw the
+buckets below an interactive reserve (RATE_LIMIT_INTERACTIVE_RESERVE), so bulk
+runs cannot take every refill from uploads being extracted elsewhere.
+"""
+import os
+import time
+import struct
+import sqlite3
+import asyncio
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+# Admission priorities (lower is served first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Claude downscales images whose long edge exceeds this, then bills ~w*h/750 tokens
+MAX_IMAGE_EDGE = 1568
+MAX_IMAGE_TOKENS = 1600
+# System prompt, user prompt and message framing sent with every invoice
+PROMPT_TOKENS = 500
+
+
+def read_image_size(image_path: str) -> Optional[tuple[int, int]]:
+    """
+    Read pixel dimensions from an image header without decoding it.
+
+    Args:
+        image_path: Path to a PNG, JPEG, GIF or WEBP file
+
+    Returns:
+        Tuple of (width, height), or None if the format is not recognised
+    """
+    with open(image_path, "rb") as f:
+        head = f.read(32)
+
+        if head.startswith(b"\x89PNG\r\n\x1a\n"):
+            width, height = struct.unpack(">II", head[16:24])
+            return width, height
+
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            width, height = struct.unpack("<HH", head[6:10])
+            return width, height
+
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            chunk = head[12:16]
+            if chunk == b"VP8X":
+                width = int.from_bytes(head[24:27], "little") + 1
+                height = int.from_bytes(head[27:30], "little") + 1
+                return width, height
+            if chunk == b"VP8L":
+                bits = int.from_bytes(head[21:25], "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8 ":
+                width, height = struct.unpack("<HH", head[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            return None
+
+        if head[:2] == b"\xff\xd8":
+            # Walk JPEG segments until a start-of-frame marker
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                code = marker[1]
+                if code == 0xFF:
+                    f.seek(-1, os.SEEK_CUR)
+                    continue
+                length_bytes = f.read(2)
+                if len(length_bytes) < 2:
+                    return None
+                length = struct.unpack(">H", length_bytes)[0]
+                if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+                    frame = f.read(5)
+                    height, width = struct.unpack(">HH", frame[1:5])
+                    return width, height
+                f.seek(length - 2, os.SEEK_CUR)
+
+    return None
+
+
+def estimate_input_tokens(image_path: str) -> int:
+    """
+    Estimate the input tokens an extraction request for this image will use.
+
+    Args:
+        image_path: Path to the invoice image
+
+    Returns:
+        Estimated input tokens (image plus prompts)
+    """
+    try:
+        size = read_image_size(image_path)
+    except (OSError, struct.error):
+        size = None
+
+    if not size or not size[0] or not size[1]:
+        return MAX_IMAGE_TOKENS + PROMPT_TOKENS
+
+    width, height = size
+    scale = min(1.0, MAX_IMAGE_EDGE / max(width, height))
+    image_tokens = int(width * scale) * int(height * scale) // 750
+    return min(image_tokens, MAX_IMAGE_TOKENS) + PROMPT_TOKENS
+
+
+class MemoryBucketBackend:
+    """Token buckets held in this process only."""
+
+    # try_consume is cheap and lock-free, so it runs on the event loop
+    blocking = False
+
+    def __init__(self, requests_per_minute: int, input_tokens_per_minute: int):
+        self.capacity = {"requests": float(requests_per_minute), "tokens": float(input_tokens_per_minute)}
+        self.levels = dict(self.capacity)
+        self.updated = time.monotonic()
+
+    def try_consume(self, tokens: int, reserve: float = 0.0) -> float:
+        """
+        Take one request and `tokens` input tokens if both buckets allow it.
+
+        Args:
+            tokens: Estimated input tokens for the request
+            reserve: Fraction of each bucket that must be left afterwards
+
+        Returns:
+            0 if admitted, otherwise seconds until enough budget refills
+        """
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        for name, capacity in self.capacity.items():
+            self.levels[name] = min(capacity, self.levels[name] + elapsed * capacity / 60.0)
+
+        wanted = _wanted(self.capacity, tokens, reserve)
+        delay = _refill_delay(self.levels, self.capacity, wanted, reserve)
+        if delay <= 0:
+            for name, amount in wanted.items():
+                self.levels[name] -= amount
+        return delay
+
+
+class SQLiteBucketBackend:
+    """Token buckets stored in a SQLite file so several processes share one budget."""
+
+    # try_consume may wait on other processes' write lock, so it runs in a thread
+    blocking = True
+
+    def __init__(self, db_path: str, requests_per_minute: int, input_tokens_per_minute: int):
+        self.db_path = db_path
+        self.capacity = {"requests": float(requests_per_minute), "tokens": float(input_tokens_per_minute)}
+
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                "name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+
+    def try_consume(self, tokens: int, reserve: float = 0.0) -> float:
+        """
+        Take one request and `tokens` input tokens if both shared buckets allow it.
+
+        Args:
+            tokens: Estimated input tokens for the request
+            reserve: Fraction of each bucket that must be left afterwards
+
+        Returns:
+            0 if admitted, otherwise seconds until enough budget refills
+        """
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the database write lock, serialising all workers
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            rows = dict(
+                (name, (level, updated))
+                for name, level, updated in conn.execute("SELECT name, level, updated FROM rate_buckets")
+            )
+
+            levels = {}
+            for name, capacity in self.capacity.items():
+                level, updated = rows.get(name, (capacity, now))
+                levels[name] = min(capacity, level + max(0.0, now - updated) * capacity / 60.0)
+
+            wanted = _wanted(self.capacity, tokens, reserve)
+            delay = _refill_delay(levels, self.capacity, wanted, reserve)
+            if delay <= 0:
+                for name, amount in wanted.items():
+                    levels[name] -= amount
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO rate_buckets (name, level, updated) VALUES (?, ?, ?)",
+                [(name, level, now) for name, level in levels.items()],
+            )
+            conn.execute("COMMIT")
+            return delay
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+def _wanted(capacity: Dict[str, float], tokens: int, reserve: float) -> Dict[str, float]:
+    # Never ask for more than the bucket can hold above the reserve, or the request would wait forever
+    return {"requests": 1.0, "tokens": min(float(tokens), capacity["tokens"] * (1.0 - reserve))}
+
+
+def _refill_delay(
+    levels: Dict[str, float], capacity: Dict[str, float], wanted: Dict[str, float], reserve: float = 0.0
+) -> float:
+    """Seconds until every bucket holds the wanted amount plus the reserve (0 if it already does)."""
+    delay = 0.0
+    for name, amount in wanted.items():
+        missing = amount + reserve * capacity[name] - levels[name]
+        if missing > 0:
+            delay = max(delay, missing * 60.0 / capacity[name])
+    return delay
+
+
+class _Waiter:
+    __slots__ = ("tokens", "session", "priority")
+
+    def __init__(self, tokens: int, session: str, priority: int):
+        self.tokens = tokens
+        self.session = session
+        self.priority = priority
+
+
+class RateLimiter:
+    """
+    Admission controller for API calls.
+
+    Only the head waiter may draw from the buckets. The head is the oldest
+    request of the next session in round-robin order within the most urgent
+    non-empty priority, so one large batch cannot starve other sessions and
+    bulk jobs yield to interactive uploads. Bulk requests also leave
+    `interactive_reserve` of each bucket untouched, which keeps interactive
+    ahead of bulk when other processes share the backend.
+    """
+
+    def __init__(self, backend, interactive_reserve: float = 0.2):
+        """
+        Args:
+            backend: MemoryBucketBackend or SQLiteBucketBackend
+            interactive_reserve: Fraction of each bucket only interactive requests may use
+        """
+        self.backend = backend
+        self.interactive_reserve = interactive_reserve
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {}
+        self._changed: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind_loop(self):
+        # asyncio primitives belong to one loop; each CLI asyncio.run() gets a fresh one
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._queues = {}
+            self._changed = asyncio.Event()
+
+    def _head(self) -> Optional[_Waiter]:
+        for priority in sorted(self._queues):
+            sessions = self._queues[priority]
+            if sessions:
+                return next(iter(sessions.values()))[0]
+        return None
+
+    def _remove(self, waiter: _Waiter, served: bool):
+        sessions = self._queues[waiter.priority]
+        pending = sessions[waiter.session]
+        pending.remove(waiter)
+        if not pending:
+            del sessions[waiter.session]
+        elif served:
+            # Next turn goes to another session
+            sessions.move_to_end(waiter.session)
+        if not sessions:
+            del self._queues[waiter.priority]
+
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def acquire(self, tokens: int, session: str = "default", priority: int = PRIORITY_INTERACTIVE):
+        """
+        Wait until one request with `tokens` estimated input tokens may be sent.
+
+        Args:
+            tokens: Estimated input tokens for the request
+            session: Fairness key (Reflex client token, CLI run name, ...)
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BULK
+        """
+        self._bind_loop()
+        waiter = _Waiter(tokens, session, priority)
+        self._queues.setdefault(priority, OrderedDict()).setdefault(session, deque()).append(waiter)
+
+        try:
+            while True:
+                timeout = None
+                if self._head() is waiter:
+                    reserve = 0.0 if priority == PRIORITY_INTERACTIVE else self.interactive_reserve
+                    if self.backend.blocking:
+                        delay = await asyncio.to_thread(self.backend.try_consume, tokens, reserve)
+                    else:
+                        delay = self.backend.try_consume(tokens, reserve)
+                    if delay <= 0:
+                        self._remove(waiter, served=True)
+                        return
+                    timeout = delay
+
+                changed = self._changed
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._remove(waiter, served=False)
+            raise
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Get the process-wide rate limiter, configured from the environment.
+
+    RATE_LIMIT_RPM and RATE_LIMIT_INPUT_TPM set the per-minute budgets;
+    RATE_LIMIT_DB selects a shared SQLite backend; RATE_LIMIT_INTERACTIVE_RESERVE
+    is the fraction of each budget held back from bulk jobs (default 0.2).
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        requests_per_minute = int(os.getenv("RATE_LIMIT_RPM", "50"))
+        input_tokens_per_minute = int(os.getenv("RATE_LIMIT_INPUT_TPM", "30000"))
+        db_path = os.getenv("RATE_LIMIT_DB")
+
+        if db_path:
+            backend = SQLiteBucketBackend(db_path, requests_per_minute, input_tokens_per_minute)
+        else:
+            backend = MemoryBucketBackend(requests_per_minute, input_tokens_per_minute)
+        _rate_limiter = RateLimiter(
+            backend, interactive_reserve=float(os.getenv("RATE_LIMIT_INTERACTIVE_RESERVE", "0.2"))
+        )
+    return _rate_limiter
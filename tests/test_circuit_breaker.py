@@ -0,0 +1,62 @@
+import httpx
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, is_endpoint_failure
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30.0)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # a success resets the streak
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+    assert breaker.retry_after() == 30.0
+
+
+def test_half_open_probe_closes_or_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    breaker.record_failure()
+
+    clock[0] += 30.0
+    assert breaker.allow_request()  # the probe
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow_request()  # everyone else waits for the probe
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+    clock[0] += 30.0
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow_request() and breaker.retry_after() == 0.0
+
+
+def test_endpoint_failures():
+    request = httpx.Request("POST", "https://api.example/v1/messages")
+
+    def status_error(code):
+        return httpx.HTTPStatusError("", request=request, response=httpx.Response(code, request=request))
+
+    assert is_endpoint_failure(httpx.ReadTimeout("slow", request=request))
+    assert is_endpoint_failure(httpx.ConnectError("down", request=request))
+    assert is_endpoint_failure(status_error(503))
+    assert is_endpoint_failure(status_error(429))
+    assert not is_endpoint_failure(status_error(400))
+    assert not is_endpoint_failure(ValueError("bad json"))
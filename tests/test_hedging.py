@@ -0,0 +1,39 @@
+import asyncio
+
+from hedging import HedgePolicy
+
+
+def test_slow_primary_is_hedged_and_loser_cancelled():
+    policy = HedgePolicy(min_samples=3, min_delay=0.01, budget=1.0)
+    policy.latencies.extend([0.01, 0.01, 0.01])
+    calls = []
+    cancelled = []
+
+    async def send():
+        calls.append(len(calls))
+        try:
+            await asyncio.sleep(1.0 if len(calls) == 1 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return len(calls)
+
+    result = asyncio.run(policy.run(send))
+
+    assert result == 2
+    # The slow primary was cancelled and finished unwinding before run() returned
+    assert cancelled == [True]
+    assert policy.stats()["hedges"] == 1
+    assert policy.stats()["hedge_wins"] == 1
+
+
+def test_hedges_respect_budget():
+    policy = HedgePolicy(min_samples=1, min_delay=0.01, budget=0.0)
+    policy.latencies.append(0.01)
+
+    async def send():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    assert asyncio.run(policy.run(send)) == "ok"
+    assert policy.stats()["hedges"] == 0
@@ -0,0 +1,83 @@
+import random
+
+from invoice_aggregates import (
+    apply_row,
+    build_aggregates,
+    empty_aggregates,
+    merge_aggregates,
+    normalize_invoice_row,
+    parse_amount_cents,
+    parse_invoice_date,
+    summary_rows,
+)
+
+
+def make_rows(count, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        if i % 10 == 0:
+            # Failed extraction: no fields at all
+            rows.append(normalize_invoice_row({}))
+            continue
+        rows.append(normalize_invoice_row({
+            "date": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025" if i % 7 else "unknown",
+            "abn": rng.choice(["51 824 753 556", "12 345 678 901", "Not found"]),
+            "amount_inc_gst": f"${rng.randint(0, 99999) / 100:,.2f}",
+            "gst": rng.choice(["$1.10", "Not shown"]),
+            "category": rng.choice(["Fuel", "Food & Dining", "Office Supplies", ""]),
+        }))
+    return rows
+
+
+def test_build_matches_repeated_apply_row():
+    rows = make_rows(300)
+
+    incremental = empty_aggregates()
+    for row in rows:
+        apply_row(incremental, row)
+
+    assert build_aggregates(rows) == incremental
+
+
+def test_remove_and_merge_stay_consistent():
+    rows = make_rows(300)
+    aggregates = build_aggregates(rows)
+    for row in rows[:100]:
+        apply_row(aggregates, row, sign=-1)
+
+    merged = build_aggregates(rows[100:200])
+    merge_aggregates(merged, build_aggregates(rows[200:]))
+
+    assert aggregates == build_aggregates(rows[100:]) == merged
+
+
+def test_failed_extractions_are_not_counted():
+    rows = [normalize_invoice_row({}), normalize_invoice_row({"amount_inc_gst": "$11.00", "gst": "$1.00"})]
+
+    aggregates = build_aggregates(rows)
+
+    assert aggregates["total"] == {"amount_cents": 1100, "gst_cents": 100, "count": 1}
+    assert aggregates["category"] == {"Unknown": {"amount_cents": 1100, "gst_cents": 100, "count": 1}}
+
+
+def test_parsing():
+    assert parse_amount_cents("$1,234.50") == 123450
+    assert parse_amount_cents("AUD 12.5") == 1250
+    assert parse_amount_cents("Not found") is None
+    assert parse_invoice_date("03/04/2025").isoformat() == "2025-04-03"
+    assert parse_invoice_date("3.4.25").isoformat() == "2025-04-03"
+    assert parse_invoice_date("31/02/2025") is None
+
+
+def test_summary_rows_capped_at_top_n():
+    groups = {
+        f"ABN{n}": {"amount_cents": n * 100, "gst_cents": n * 10, "count": 1}
+        for n in range(1, 6)
+    }
+
+    rows = summary_rows(groups, limit=2)
+
+    assert [row["key"] for row in rows] == ["ABN5", "ABN4", "3 others"]
+    assert rows[-1] == {"key": "3 others", "amount": "$6.00", "gst": "$0.60", "count": "3"}
+    assert len(summary_rows(groups, limit=5)) == 5
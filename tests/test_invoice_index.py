@@ -0,0 +1,69 @@
+from invoice_aggregates import normalize_invoice_row
+from invoice_index import empty_index, index_row, search, unindex_row
+
+
+def make_row(description, category="Fuel", abn="51 824 753 556", amount="$10.00", date="01/03/2025"):
+    return normalize_invoice_row({
+        "description": description,
+        "category": category,
+        "abn": abn,
+        "amount_inc_gst": amount,
+        "date": date,
+    })
+
+
+def build(rows):
+    index = empty_index()
+    for key, row in rows.items():
+        index_row(index, key, row)
+    return index
+
+
+def test_prefix_and_range_queries():
+    index = build({
+        "a": make_row("Shell Coles Express unleaded", amount="$65.20", date="02/03/2025"),
+        "b": make_row("Officeworks paper", category="Office", abn="Not found", amount="$12.00", date="15/04/2025"),
+        "c": make_row("Shell diesel", amount="$120.00", date="30/04/2025"),
+    })
+
+    assert search(index) is None
+    assert search(index, text="she") == ["a", "c"]
+    assert search(index, text="shell unl") == ["a"]
+    assert search(index, text="OFFICE") == ["b"]
+    assert search(index, abn="51824753556") == ["a", "c"]
+    assert search(index, category="fuel") == ["a", "c"]
+    assert search(index, date_from="2025-04-01") == ["b", "c"]
+    assert search(index, date_from="2025-03-02", date_to="2025-04-15") == ["a", "b"]
+    assert search(index, amount_min=1200, amount_max=6520) == ["a", "b"]
+    assert search(index, text="shell", amount_min=10000) == ["c"]
+    assert search(index, text="bunnings") == []
+
+
+def test_queries_follow_edits_and_deletes():
+    rows = {
+        "a": make_row("Shell unleaded", amount="$65.20"),
+        "b": make_row("Bunnings timber", category="Hardware", amount="$40.00"),
+        "c": make_row("Shell diesel", amount="$120.00"),
+    }
+    index = build(rows)
+
+    # Edit "a": new description, category and amount
+    rows["a"] = make_row("Caltex unleaded", category="Fuel", amount="$5.00", date="01/05/2025")
+    index_row(index, "a", rows["a"])
+
+    assert search(index, text="shell") == ["c"]
+    assert search(index, text="calt") == ["a"]
+    assert search(index, amount_max=1000) == ["a"]
+    assert search(index, date_from="2025-05-01") == ["a"]
+    # Edited rows keep their place in the table order
+    assert search(index, text="unleaded") == ["a"]
+    assert search(index, category="fuel") == ["a", "c"]
+
+    unindex_row(index, "c")
+    index_row(index, "d", make_row("Shell premium", amount="$80.00"))
+
+    assert search(index, text="sh") == ["d"]
+    assert search(index, amount_min=4000) == ["b", "d"]
+    assert search(index, text="diesel") == []
+    assert "diesel" not in index["vocab"]
+    assert search(index, category="fuel") == ["a", "d"]
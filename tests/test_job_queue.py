@@ -0,0 +1,170 @@
+import pytest
+
+from circuit_breaker import MAX_DEFERRALS
+from job_queue import MAX_ATTEMPTS, SQLiteJobQueue
+from rate_limiter import PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def enqueue(queue, name, session="s1", priority=PRIORITY_INTERACTIVE):
+    return queue.enqueue(session, f"/uploads/{name}", name, name, 1.0, priority=priority)
+
+
+def test_claims_interactive_before_bulk(queue):
+    bulk = enqueue(queue, "bulk.jpg", priority=PRIORITY_BULK)
+    interactive = enqueue(queue, "upload.jpg")
+
+    assert queue.claim()["id"] == interactive
+    assert queue.claim()["id"] == bulk
+    assert queue.claim() is None
+
+
+def test_sessions_take_turns(queue):
+    big = [enqueue(queue, f"big{n}.jpg", session="big") for n in range(3)]
+    small = [enqueue(queue, f"small{n}.jpg", session="small") for n in range(2)]
+
+    # One worker slot: each job finishes before the next claim
+    order = []
+    while (job := queue.claim()) is not None:
+        order.append(job["id"])
+        queue.complete(job["id"], job["lease_until"], {"status": "success"})
+
+    assert order == [big[0], small[0], big[1], small[1], big[2]]
+
+
+def test_session_with_fewest_running_jobs_goes_first(queue):
+    big = [enqueue(queue, f"big{n}.jpg", session="big") for n in range(3)]
+    small = enqueue(queue, "small.jpg", session="small")
+
+    assert queue.claim()["id"] == big[0]
+    # "big" already has a job running, so the later upload is not stuck behind it
+    assert queue.claim()["id"] == small
+    assert queue.claim()["id"] == big[1]
+
+
+def test_expired_lease_is_reclaimed(queue):
+    job_id = enqueue(queue, "a.jpg")
+
+    first = queue.claim(lease_seconds=-1)  # worker dies holding an already-expired lease
+    second = queue.claim()
+
+    assert first["id"] == second["id"] == job_id
+    assert second["attempts"] == 2
+    # A live lease is not handed out again
+    assert queue.claim() is None
+
+
+def test_job_abandoned_after_max_attempts(queue):
+    job_id = enqueue(queue, "crashes-worker.jpg")
+    for _ in range(MAX_ATTEMPTS):
+        assert queue.claim(lease_seconds=-1)["id"] == job_id
+
+    assert queue.claim() is None
+    finished = queue.take_finished("s1")
+    assert [job["id"] for job in finished] == [job_id]
+    assert finished[0]["status"] == "error"
+    assert "abandoned" in finished[0]["result"]["message"]
+
+
+def test_results_delivered_once_to_owning_session(queue):
+    mine = enqueue(queue, "mine.jpg", session="s1")
+    enqueue(queue, "theirs.jpg", session="s2")
+
+    job = queue.claim()
+    assert job["id"] == mine
+    assert [j["status"] for j in queue.pending_jobs("s1")] == ["running"]
+
+    queue.complete(mine, job["lease_until"], {"status": "success", "data": {"date": "01/02/2025"}})
+
+    delivered = queue.take_finished("s1")
+    assert [j["result"]["data"]["date"] for j in delivered] == ["01/02/2025"]
+    assert queue.take_finished("s1") == []
+    assert queue.pending_jobs("s1") == []
+    assert [j["original_name"] for j in queue.pending_jobs("s2")] == ["theirs.jpg"]
+
+
+def test_retry_counts_attempts(queue):
+    job_id = enqueue(queue, "always-times-out.jpg")
+    for _ in range(MAX_ATTEMPTS):
+        job = queue.claim()
+        assert job["id"] == job_id
+        queue.retry(job_id, job["lease_until"])
+
+    # Transient failures use up attempts, so the job cannot loop forever
+    assert queue.claim() is None
+    assert queue.take_finished("s1")[0]["status"] == "error"
+
+
+def test_deferrals_do_not_use_attempts_but_are_capped(queue):
+    job_id = enqueue(queue, "a.jpg")
+    for _ in range(MAX_DEFERRALS - 1):
+        job = queue.claim()
+        assert job["id"] == job_id and job["attempts"] == 1
+        queue.defer(job_id, job["lease_until"], delay=0.0)
+        assert [j["status"] for j in queue.pending_jobs("s1")] == ["deferred"]
+
+    job = queue.claim()
+    queue.defer(job_id, job["lease_until"], delay=0.0)
+
+    assert queue.claim() is None
+    finished = queue.take_finished("s1")
+    assert finished[0]["status"] == "error"
+    assert "still unavailable" in finished[0]["result"]["message"]
+
+
+def test_deferred_job_waits_for_probe(queue):
+    job_id = enqueue(queue, "a.jpg")
+    job = queue.claim()
+    queue.defer(job_id, job["lease_until"], delay=60.0)
+
+    assert queue.claim() is None
+
+
+def test_last_progress_tracks_worker_activity(queue):
+    job_id = enqueue(queue, "a.jpg")
+    assert queue.last_progress() is None
+
+    job = queue.claim()
+    claimed_at = queue.last_progress()
+    assert claimed_at is not None
+
+    queue.complete(job_id, job["lease_until"], {"status": "success"})
+    assert queue.last_progress() >= claimed_at
+
+
+def test_expired_lease_cannot_overwrite_new_holder(queue):
+    job_id = enqueue(queue, "a.jpg")
+    stale = queue.claim(lease_seconds=-1)
+    current = queue.claim()
+
+    # The first worker comes back after its lease was reclaimed
+    assert not queue.complete(job_id, stale["lease_until"], {"status": "error", "message": "late"})
+    assert not queue.retry(job_id, stale["lease_until"])
+    assert not queue.defer(job_id, stale["lease_until"], delay=0.0)
+    assert [j["status"] for j in queue.pending_jobs("s1")] == ["running"]
+
+    assert queue.complete(job_id, current["lease_until"], {"status": "success"})
+    assert queue.take_finished("s1")[0]["status"] == "done"
+
+
+def test_cancel_session_drops_its_jobs(queue):
+    running = enqueue(queue, "running.jpg", session="s1")
+    finished = enqueue(queue, "finished.jpg", session="s1")
+    enqueue(queue, "queued.jpg", session="s1")
+    running_job = queue.claim()
+    finished_job = queue.claim()
+    assert (running_job["id"], finished_job["id"]) == (running, finished)
+    other = enqueue(queue, "theirs.jpg", session="s2")
+    queue.complete(finished, finished_job["lease_until"], {"status": "success"})
+
+    queue.cancel_session("s1")
+
+    assert queue.pending_jobs("s1") == []
+    assert queue.take_finished("s1") == []
+    # The worker still extracting a cancelled job cannot store its result
+    assert not queue.complete(running, running_job["lease_until"], {"status": "success"})
+    assert queue.claim()["id"] == other
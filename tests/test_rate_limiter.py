@@ -0,0 +1,99 @@
+import asyncio
+import struct
+
+from rate_limiter import (
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    MemoryBucketBackend,
+    RateLimiter,
+    SQLiteBucketBackend,
+    estimate_input_tokens,
+    read_image_size,
+)
+
+
+def run_admissions(backend, requests):
+    """Start every (session, priority, n) request together and return the admission order."""
+    # No reserve: these tests check the in-process queue order on its own
+    limiter = RateLimiter(backend, interactive_reserve=0.0)
+    order = []
+
+    async def request(session, priority, n):
+        await limiter.acquire(100, session, priority)
+        order.append((session, n))
+
+    async def main():
+        await asyncio.gather(*(request(*r) for r in requests))
+
+    asyncio.run(main())
+    return order
+
+
+def starved_backend():
+    # 600 requests/minute refills one request every 0.1 s; start empty so everyone queues
+    backend = MemoryBucketBackend(600, 1_000_000)
+    backend.levels["requests"] = 0.0
+    return backend
+
+
+def test_interactive_before_bulk_and_round_robin_across_sessions():
+    requests = (
+        [("A", PRIORITY_BULK, n) for n in range(3)]
+        + [("B", PRIORITY_BULK, n) for n in range(2)]
+        + [("C", PRIORITY_INTERACTIVE, n) for n in range(2)]
+    )
+
+    order = run_admissions(starved_backend(), requests)
+
+    assert order == [("C", 0), ("C", 1), ("A", 0), ("B", 0), ("A", 1), ("B", 1), ("A", 2)]
+
+
+def test_sqlite_backend_shares_one_budget(tmp_path):
+    db_path = str(tmp_path / "limit.sqlite3")
+    first = SQLiteBucketBackend(db_path, 2, 1_000_000)
+    second = SQLiteBucketBackend(db_path, 2, 1_000_000)
+
+    assert first.try_consume(100) == 0
+    assert second.try_consume(100) == 0
+    # Both processes drew from the same two-request bucket
+    assert first.try_consume(100) > 0
+
+    order = run_admissions(SQLiteBucketBackend(str(tmp_path / "other.sqlite3"), 600, 1_000_000), [
+        ("A", PRIORITY_BULK, 0),
+        ("B", PRIORITY_INTERACTIVE, 0),
+    ])
+    assert sorted(order) == [("A", 0), ("B", 0)]
+
+
+def test_bulk_leaves_reserve_for_interactive_in_other_processes(tmp_path):
+    db_path = str(tmp_path / "limit.sqlite3")
+    # Stand-ins for a bulk CLI run and an upload worker sharing one budget of 10 requests/minute
+    cli = RateLimiter(SQLiteBucketBackend(db_path, 10, 1_000_000), interactive_reserve=0.2)
+    worker = RateLimiter(SQLiteBucketBackend(db_path, 10, 1_000_000), interactive_reserve=0.2)
+
+    async def admitted(limiter, priority):
+        try:
+            await asyncio.wait_for(limiter.acquire(100, "s", priority), timeout=0.5)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def main():
+        bulk = [await admitted(cli, PRIORITY_BULK) for _ in range(9)]
+        interactive = [await admitted(worker, PRIORITY_INTERACTIVE) for _ in range(2)]
+        return bulk, interactive
+
+    bulk, interactive = asyncio.run(main())
+
+    # Bulk stops at the 2-request reserve; the other process's uploads still get it
+    assert bulk == [True] * 8 + [False]
+    assert interactive == [True, True]
+
+
+def test_token_estimate_from_image_header(tmp_path):
+    png = tmp_path / "invoice.png"
+    png.write_bytes(b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", 3000, 4000))
+
+    assert read_image_size(str(png)) == (3000, 4000)
+    # Scaled to a 1568 px long edge, then capped at the per-image maximum
+    assert estimate_input_tokens(str(png)) == 1600 + 500